@@ -13,9 +13,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import os
 import warnings
 
-from . import io, workflow
+import rmm
+
+# Opt-in RMM memory pool, so that the many short-lived per-column device
+# allocations made by the operators are served from a pool instead of
+# cudaMalloc/cudaFree. NVT_RMM_POOL=1 enables it, NVT_RMM_POOL_SIZE sets the
+# initial pool size in bytes (1 GiB by default).
+if os.environ.get("NVT_RMM_POOL", "0") not in ("", "0"):
+    rmm.reinitialize(
+        pool_allocator=True, initial_pool_size=int(os.environ.get("NVT_RMM_POOL_SIZE", 2 ** 30))
+    )
+
+from . import io, workflow  # noqa: E402
 
 Workflow = workflow.Workflow
 dataset = io.GPUDatasetIterator
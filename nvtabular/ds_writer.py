@@ -14,18 +14,15 @@
 # limitations under the License.
 #
 
-import glob
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-import cudf
+import cupy as cp
 import numpy as np
+import pyarrow as pa
 import pyarrow.parquet as pq
 
-try:
-    import cupy as cp
-except ImportError:
-    import numpy as cp
-
 
 class FileIterator:
     def __init__(self, path, nfiles, shuffle=True, **kwargs):
@@ -53,48 +50,73 @@ class FileIterator:
 
 
 class DatasetWriter:
-    def __init__(self, path, nfiles=1, **kwargs):
+    def __init__(self, path, nfiles=1, row_group_size=1000000, **kwargs):
         self.path = path
         self.nfiles = nfiles
-        self.writers = {fn: None for fn in FileIterator(path, nfiles)}
+        self.row_group_size = row_group_size
+        # taken from the first table written, shared by every file's writer
+        self.schema = None
+        # output file names, formatted once and reused for every chunk
+        self.file_names = list(FileIterator(path, nfiles, shuffle=False))
+        self.writers = {fn: None for fn in self.file_names}
+        # per-file host tables, written out as one row group once large enough
+        self.buffers = {fn: [] for fn in self.file_names}
         self.shared_meta_path = str(path) + "/_metadata"
         self.metadata = None
-        self.new_metadata = {fn: [] for fn in FileIterator(path, nfiles)}
+        self.new_metadata = {fn: [] for fn in self.file_names}
+        # row groups are written by a single background thread (which keeps
+        # them in order), so that disk writes overlap with the next chunk
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = deque()
+        self.closed = False
 
-        # Check for _metadata
-        metafile = glob.glob(self.shared_meta_path)
-        if metafile:
-            self.metadata = pq.ParquetDataset(metafile[0]).metadata
+        # Check for _metadata, only its footer is needed (no dataset discovery)
+        if os.path.isfile(self.shared_meta_path):
+            self.metadata = pq.read_metadata(self.shared_meta_path)
 
     def write(self, gdf, shuffle=True):
 
         # Shuffle the dataframe
         gdf_size = len(gdf)
         if shuffle:
-            sort_key = "__sort_index__"
-            arr = cp.arange(gdf_size)
-            cp.random.shuffle(arr)
-            gdf[sort_key] = cudf.Series(arr)
-            gdf = gdf.sort_values(sort_key).drop(columns=[sort_key])
+            # a single gather by a random permutation, chunks below are slices
+            gdf = gdf.iloc[cp.random.permutation(gdf_size)]
 
         # Write to
         chunk_size = int(gdf_size / self.nfiles)
-        for i, fn in enumerate(FileIterator(self.path, self.nfiles)):
+        for i, fn in enumerate(self.file_names):
             s1 = i * chunk_size
             s2 = (i + 1) * chunk_size
             if i == (self.nfiles - 1):
                 s2 = gdf_size
             chunk = gdf[s1:s2]
-            pa_table = chunk.to_arrow()
-            if self.writers[fn] is None:
-                self.writers[fn] = pq.ParquetWriter(
-                    fn, pa_table.schema, metadata_collector=self.new_metadata[fn],
-                )
+            self.buffers[fn].append(chunk.to_arrow())
+            if sum(t.num_rows for t in self.buffers[fn]) >= self.row_group_size:
+                self._flush(fn)
+
+    def _flush(self, fn, sync=False):
+        tables = self.buffers[fn]
+        if not tables:
+            return
+        pa_table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+        self.buffers[fn] = []
+        if self.schema is None:
+            self.schema = pa_table.schema
+        if self.writers[fn] is None:
+            self.writers[fn] = pq.ParquetWriter(
+                fn, self.schema, metadata_collector=self.new_metadata[fn],
+            )
+        if sync:
             self.writers[fn].write_table(pa_table)
+            return
+        # bound the host tables waiting to be written
+        while len(self.pending) >= 2 * self.nfiles:
+            self.pending.popleft().result()
+        self.pending.append(self.executor.submit(self.writers[fn].write_table, pa_table))
 
     def write_metadata(self):
         self.close_writers()  # Writers must be closed to get metadata
-        fns = [fn for fn in FileIterator(self.path, self.nfiles, shuffle=False)]
+        fns = self.file_names
         if self.metadata is not None:
             _meta = self.metadata
             i_start = 0
@@ -107,18 +129,31 @@ class DatasetWriter:
             _meta_new = self.new_metadata[fns[i]]
             if _meta_new:
                 _meta.append_row_groups(_meta_new[0])
-        with open(self.shared_meta_path, "wb") as fil:
-            _meta.write_metadata_file(fil)
+        # let arrow open and write the file natively, not through a python file object
+        _meta.write_metadata_file(self.shared_meta_path)
         self.metadata = _meta
         return
 
     def close_writers(self):
-        for fn, writer in self.writers.items():
+        if self.closed:
+            return
+        # wait for the queued row groups, then write what is left on this
+        # thread (nothing is submitted, so this is also safe from __del__)
+        while self.pending:
+            self.pending.popleft().result()
+        self.executor.shutdown(wait=True)
+        for fn in self.writers:
+            self._flush(fn, sync=True)
+        for fn in self.writers:
+            writer = self.writers[fn]
             if writer is not None:
                 writer.close()
                 # Set row-group file paths
                 self.new_metadata[fn][0].set_file_path(os.path.basename(fn))
-                writer = None
+                self.writers[fn] = None
+        self.closed = True
 
     def __del__(self):
-        self.close_writers()
+        # no-op once closed (e.g. by write_metadata), or if __init__ failed
+        if not getattr(self, "closed", True):
+            self.close_writers()
@@ -202,13 +202,12 @@ class DLLabelEncoder(object):
         self._cats_parts.append(y_uniqs.to_pandas())
 
     def _fit_unique_finalize(self):
-        y_uniqs = cudf.Series([]) if self._cats_host is None else cudf.from_pandas(self._cats_host)
-        for i in range(len(self._cats_parts)):
-            y_uniqs_part = cudf.from_pandas(self._cats_parts.pop())
-            if y_uniqs.shape[0] == 0:
-                y_uniqs = y_uniqs_part
-            else:
-                y_uniqs = y_uniqs.append(y_uniqs_part).unique()  # Check merge option as well
+        parts = [cudf.from_pandas(part) for part in self._cats_parts]
+        self._cats_parts = []
+        if self._cats_host is not None:
+            parts.insert(0, cudf.from_pandas(self._cats_host))
+        # union all chunk uniques in a single pass
+        y_uniqs = cudf.concat(parts).unique() if parts else cudf.Series([])
 
         # Can't just pass None as a placeholder, since that automatically gets converted
         # to -1 later (cudf.Series([None]).to_pandas() == (-1,)) for int columns.
@@ -296,6 +295,89 @@ class DLLabelEncoder(object):
         return "{0}(_cats={1!r})".format(type(self).__name__, self.get_cats().values_to_string())
 
 
+def batch_transform(encoders, gdf, names):
+    """
+    Maps the columns `names` of gdf to unique ids. Columns that share a
+    dtype are encoded together with a single merge against a packed
+    (column, value, code) table, instead of one merge per column. Columns
+    are only packed together as long as the whole merge (the stacked
+    values, the packed categories and the merge result) fits in the
+    transformation memory limit, anything else uses the per-column
+    `DLLabelEncoder.transform`.
+
+    Parameters
+    -----------
+    encoders : dict of DLLabelEncoder
+        fitted encoders, keyed by column name
+    gdf : cudf DataFrame
+    names : list of str
+        columns of gdf to encode
+
+    Returns
+    -----------
+    encoded: dict of cudf Series
+    """
+    encoded = {}
+    groups = {}
+    avail_gpu_mem = rmm.get_info().free
+    nrows = len(gdf)
+    for name in names:
+        enc = encoders[name]
+        if enc._cats_host is None or len(enc._cats_host) == 0:
+            raise Exception("Encoder was not fit!")
+        if enc._cats_host.dtype != gdf[name].dtype:
+            encoded[name] = enc.transform(gdf[name])
+            continue
+        # device bytes this column adds to a packed merge: the category table
+        # (value, int32 col, int64 code) and the stacked values (value, int32
+        # col, int64 order), which the merge result repeats along with a code
+        itemsize = enc._cats_host.dtype.itemsize
+        size = len(enc._cats_host) * (itemsize + 12) + nrows * 2 * (itemsize + 20)
+        budget = avail_gpu_mem * enc.gpu_mem_trans_use
+        # greedily pack same-dtype columns into groups that fit the budget
+        grps = groups.setdefault(gdf[name].dtype, [])
+        if grps and grps[-1][1] + size <= budget:
+            grps[-1][0].append(name)
+            grps[-1][1] += size
+        else:
+            grps.append([[name], size])
+
+    for grp, _ in (grp for grps in groups.values() for grp in grps):
+        if len(grp) == 1:
+            encoded[grp[0]] = encoders[grp[0]].transform(gdf[grp[0]])
+            continue
+        vals = cudf.DataFrame(
+            {
+                "value": cudf.concat([gdf[name] for name in grp], ignore_index=True),
+                "col": cp.repeat(cp.arange(len(grp), dtype="int32"), nrows),
+                "order": cp.arange(len(grp) * nrows),
+            }
+        )
+        cats = []
+        for idx, name in enumerate(grp):
+            enc_cats = encoders[name].get_cats()
+            cats.append(
+                cudf.DataFrame(
+                    {
+                        "value": enc_cats,
+                        "col": cp.full(len(enc_cats), idx, dtype="int32"),
+                        "code": cp.arange(len(enc_cats)),
+                    }
+                )
+            )
+        merged = vals.merge(cudf.concat(cats, ignore_index=True), on=["col", "value"], how="left")
+        vals = cats = None
+        # scatter the codes back into row order, rather than sorting the
+        # whole merge result by "order"; unknown values map to 0
+        codes = cp.zeros(len(grp) * nrows, dtype="int64")
+        order = cp.asarray(merged["order"]._column.data_array_view)
+        codes[order] = cp.asarray(merged["code"].fillna(0).astype("int64")._column.data_array_view)
+        merged = None
+        for idx, name in enumerate(grp):
+            encoded[name] = cudf.Series(codes[idx * nrows : (idx + 1) * nrows], index=gdf.index)
+    return encoded
+
+
 def _get_na_value(dtype):
     """ Returns a suitable value for missing values based off the dtype of the col """
     if np.issubdtype(dtype, np.integer):
@@ -24,6 +24,8 @@ from itertools import islice
 import cudf
 import cupy as cp
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import rmm
 from cudf._lib.nvtx import annotate
 from cudf.io.parquet import ParquetWriter
@@ -35,10 +37,205 @@ LOG = logging.getLogger("nvtabular")
 #
 
 
-def _allowable_batch_size(gpu_memory_frac, row_size):
-    free_mem = rmm.get_info().free
-    gpu_memory = free_mem * gpu_memory_frac
-    return max(int(gpu_memory / row_size), 1)
+def _estimate_row_size(gdf):
+    """
+    Estimates the device bytes per row of gdf. Strings are counted as their
+    average byte length (computed on the GPU) plus an offset.
+    """
+    row_size = 0
+    for name in gdf.columns:
+        col = gdf[name]
+        if col.dtype == "object":
+            row_size += int(col.str.byte_count().sum()) // max(len(col), 1) + 4
+        else:
+            row_size += col.dtype.itemsize
+    return row_size
+
+
+# (num_rows, num_row_groups, row_size, rows per row-group) per (parquet path, mtime),
+# the oldest entries are dropped past _PQ_META_CACHE_SIZE files
+_PQ_META_CACHE_SIZE = 4096
+_pq_meta_cache = {}
+
+
+def _pq_file_meta(file_path, reader):
+    """
+    Returns the row count, row-group count, estimated row size and the row
+    count of every row-group of a parquet file. Results are cached until the file is modified, so
+    iterating over a dataset again doesn't re-parse every footer.
+    """
+    key = (str(file_path), os.stat(file_path).st_mtime_ns)
+    meta = _pq_meta_cache.get(key)
+    if meta is not None:
+        return meta
+
+    md = pq.read_metadata(file_path)
+    rg = md.row_group(0) if md.num_row_groups > 0 else None
+    chunks = {}
+    if rg is not None:
+        chunks = {rg.column(i).path_in_schema: rg.column(i) for i in range(rg.num_columns)}
+    row_size = 0
+    for field in md.schema.to_arrow_schema():
+        if field.name.startswith("__index_level_"):
+            continue
+        # dictionary columns are read back as strings/categoricals
+        bit_width = None
+        if not pa.types.is_dictionary(field.type):
+            try:
+                bit_width = field.type.bit_width
+            except ValueError:  # variable-width type (strings)
+                pass
+        if bit_width is not None:
+            row_size += max(bit_width // 8, 1)
+            continue
+        # strings: average stored bytes per row in the first row-group.
+        # NOTE: `total_uncompressed_size` is not representative of dataframe
+        #       size for dictionary-encoded columns (parquet only stores
+        #       uniques), so read the first row instead for those
+        chunk = chunks.get(field.name)
+        if chunk is None or rg.num_rows == 0 or any("DICT" in e for e in chunk.encodings):
+            row_size = None
+            break
+        row_size += chunk.total_uncompressed_size // rg.num_rows + 4
+    if row_size is None:
+        row_size = 0
+        if md.num_rows > 0:
+            # removed logic for max in first x rows, it was
+            # causing infinite loops for our customers on their datasets.
+            row_size = _estimate_row_size(reader(file_path, num_rows=1))
+    rg_rows = tuple(md.row_group(i).num_rows for i in range(md.num_row_groups))
+    if len(_pq_meta_cache) >= _PQ_META_CACHE_SIZE:
+        # dicts keep insertion order, so this drops the oldest entry
+        del _pq_meta_cache[next(iter(_pq_meta_cache))]
+    meta = _pq_meta_cache[key] = (md.num_rows, md.num_row_groups, row_size, rg_rows)
+    return meta
+
+
+def _pack_row_groups(rg_rows, max_rows):
+    """
+    Greedily packs consecutive row-groups into batches of at most max_rows
+    rows (a larger row-group gets a batch of its own). Returns a list of
+    (first row-group, row-group count) per batch.
+    """
+    batches = []
+    start, rows = 0, 0
+    for rg, num_rows in enumerate(rg_rows):
+        if rg > start and rows + num_rows > max_rows:
+            batches.append((start, rg - start))
+            start, rows = rg, 0
+        rows += num_rows
+    if start < len(rg_rows):
+        batches.append((start, len(rg_rows) - start))
+    return batches
+
+
+# chunks read ahead of the consumer by _prefetch
+_PREFETCH_DEPTH = 1
+
+
+def _prefetch(itr, depth=_PREFETCH_DEPTH):
+    """
+    Iterate over itr while a background thread reads up to depth chunks
+    ahead, so the next chunk is read while the current one is processed.
+    Up to depth + 2 chunks are live at once (the consumer's, the queued ones
+    and the one being read). The thread stops and the queued chunks are
+    dropped as soon as the consumer stops, even if it doesn't reach the end.
+    """
+    q = queue.Queue(depth)
+    done = object()
+    stop = threading.Event()
+
+    def _put(item):
+        # gives up once the consumer has gone away
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _reader():
+        try:
+            for chunk in itr:
+                if stop.is_set() or not _put(chunk):
+                    return
+                chunk = None
+        except Exception as e:  # re-raised on the consumer side
+            _put(e)
+            return
+        finally:
+            close = getattr(itr, "close", None)
+            if close is not None:
+                close()
+        _put(done)
+
+    threading.Thread(target=_reader, daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            item = None
+    finally:
+        stop.set()
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+
+
+# parses each hex string straight from the string column's offsets/chars,
+# strings with anything but hex digits (including a "0x" prefix) become 0
+_htoi_kernel = cp.ElementwiseKernel(
+    "raw int32 offsets, raw uint8 chars",
+    "int32 out",
+    """
+    unsigned int v = 0;
+    for (int k = offsets[i]; k < offsets[i + 1]; ++k) {
+        unsigned int c = chars[k];
+        if (!((c >= '0' && c <= '9') || ((c | 0x20) >= 'a' && (c | 0x20) <= 'f'))) {
+            v = 0;
+            break;
+        }
+        v = (v << 4) | ((c & 0xF) + (c >> 6) * 9);
+    }
+    out = (int) v;
+    """,
+    "nvt_htoi",
+)
+
+
+def _hex_to_int32(ser):
+    """ Converts a Series of hex strings to int32 in a single kernel (nulls become 0) """
+    out = cp.zeros(len(ser), dtype=cp.int32)
+    if len(ser):
+        col = ser._column
+        offsets, chars = col.children
+        # a sliced column shares its parent's children, its rows start at
+        # col.offset in the offsets (which still index the whole chars buffer)
+        _htoi_kernel(
+            cp.asarray(offsets.data_array_view)[col.offset : col.offset + len(ser) + 1],
+            cp.asarray(chars.data_array_view).view(cp.uint8),
+            out,
+        )
+        if ser.has_nulls:
+            out[ser.isnull().values] = 0
+    return cudf.Series(out, index=ser.index)
+
+
+def _parser_dtype(dtype):
+    """ Normalises a dtype (name, numpy type or dtype) to a name read_csv accepts """
+    try:
+        name = np.dtype(dtype).name
+    except TypeError:
+        # e.g. "category", which only cudf understands
+        return dtype
+    return "str" if name == "object" else name
 
 
 def _get_read_engine(engine, file_path, **kwargs):
@@ -100,61 +297,102 @@ class PQFileReader(GPUFileReader):
     def intialize_reader(self, gpu_memory_frac, batch_size, **kwargs):
         self.reader = cudf.read_parquet
 
-        # Read Parquet-file metadata
-        (self.num_rows, self.num_row_groups, columns,) = cudf.io.read_parquet_metadata(
-            self.file_path
+        # Read Parquet-file metadata (and estimate memory-reqs per row)
+        self.num_rows, self.num_row_groups, row_size, rg_rows = _pq_file_meta(
+            self.file_path, self.reader
         )
-        # Use first row-group metadata to estimate memory-rqs
-        # NOTE: We could also use parquet metadata here, but
-        #       `total_uncompressed_size` for each column is
-        #       not representative of dataframe size for
-        #       strings/categoricals (parquet only stores uniques)
-        self.row_size = self.row_size or 0
-        if self.num_rows > 0 and self.row_size == 0:
-            for col in self.reader(self.file_path, num_rows=1)._columns:
-                # removed logic for max in first x rows, it was
-                # causing infinite loops for our customers on their datasets.
-                self.row_size += col.dtype.itemsize
+        self.row_size = self.row_size or row_size
         # Check if we are using row groups
         self.use_row_groups = kwargs.get("use_row_groups", None)
-        self.row_group_batch = 1
+        self.row_group_batches = [(rg, 1) for rg in range(self.num_row_groups)]
         self.next_row_group = 0
 
         # Determine batch size if needed
+        self.adaptive = False
         if batch_size and not self.use_row_groups:
             self.batch_size = batch_size
             self.use_row_groups = False
         else:
+            # batches sized from memory are adjusted as chunks are read,
+            # unless the caller needs a fixed chunk count
+            self.adaptive = kwargs.get("adaptive_batch_size", True)
+            self.mem_budget = rmm.get_info().free * gpu_memory_frac
             # Use row size to calculate "allowable" batch size
-            gpu_memory_batch = _allowable_batch_size(gpu_memory_frac, self.row_size)
+            gpu_memory_batch = max(int(self.mem_budget / self.row_size), 1)
             self.batch_size = min(gpu_memory_batch, self.num_rows)
 
             # Use row-groups if they meet memory constraints
-            rg_size = int(self.num_rows / self.num_row_groups)
+            rg_size = max(rg_rows, default=0)
             if (self.use_row_groups is None) and (rg_size <= gpu_memory_batch):
                 self.use_row_groups = True
             elif self.use_row_groups is None:
                 self.use_row_groups = False
 
-            # Determine row-groups per batch
+            # Pack row-groups into batches by their actual row counts, rather
+            # than a fixed number of row-groups sized from the average
             if self.use_row_groups:
-                self.row_group_batch = max(int(gpu_memory_batch / rg_size), 1)
+                self.row_group_batches = _pack_row_groups(rg_rows, gpu_memory_batch)
 
     def __len__(self):
+        """ Returns the number of dataframe chunks in the file. For an adaptive
+        reader this is only an estimate from the initial batch size, pass
+        adaptive_batch_size=False when the exact count is needed """
+        if self.use_row_groups:
+            return len(self.row_group_batches)
         return int((self.num_rows + self.batch_size - 1) // self.batch_size)
 
+    def _next_batch_size(self, batch_size, gdf):
+        # AIMD on the device memory the chunk just read actually takes up,
+        # against the budget taken when the reader was created. Free memory
+        # isn't a usable signal here: it never recovers under an RMM pool
+        # and it also counts the chunks held by prefetching.
+        used = _estimate_row_size(gdf) * len(gdf)
+        if used > self.mem_budget:
+            return max(batch_size // 2, 1)
+        limit = max(int(self.mem_budget * len(gdf) / max(used, 1)), 1)
+        return max(min(int(batch_size * 1.1) + 1, limit, self.num_rows), 1)
+
     def __iter__(self):
-        for nskip in range(0, self.num_rows, self.batch_size):
-            # not using row groups because concat uses up double memory
-            # making iterator unable to use selected gpu memory fraction.
-            batch = min(self.batch_size, self.num_rows - nskip)
+        if self.use_row_groups:
+            yield from self._iter_row_groups()
+            return
+        nskip = 0
+        batch_size = self.batch_size
+        while nskip < self.num_rows:
+            batch = min(batch_size, self.num_rows - nskip)
             LOG.debug(
                 "loading chunk from %s, (skip_rows=%s, num_rows=%s)", self.file_path, nskip, batch
             )
             gdf = self.reader(
                 self.file_path, num_rows=batch, skip_rows=nskip, engine="cudf", columns=self.columns
             )
-            gdf.reset_index(drop=True, inplace=True)
+            # a RangeIndex is metadata only, unlike reset_index
+            gdf.index = cudf.RangeIndex(len(gdf))
+            nskip += batch
+            if self.adaptive:
+                batch_size = self._next_batch_size(batch_size, gdf)
+            yield gdf
+            gdf = None
+
+    def _iter_row_groups(self):
+        # whole row-groups are decoded straight into one frame per batch,
+        # rather than reading row-groups separately and concatenating them
+        # (which uses up double memory)
+        for rg, count in self.row_group_batches:
+            LOG.debug(
+                "loading chunk from %s, (row_group=%s, row_group_count=%s)",
+                self.file_path,
+                rg,
+                count,
+            )
+            gdf = self.reader(
+                self.file_path,
+                row_group=rg,
+                row_group_count=count,
+                engine="cudf",
+                columns=self.columns,
+            )
+            gdf.index = cudf.RangeIndex(len(gdf))
             yield gdf
             gdf = None
 
@@ -179,7 +417,10 @@ class CSVFileReader(GPUFileReader):
         self.names = []
         dtype_inf = {}
         nrows = 10
-        head = "".join(islice(open(self.file_path), nrows))
+        # only the head is read on the host, row counts aren't needed since
+        # chunks are byte ranges
+        with open(self.file_path, "rb") as f:
+            head = b"".join(islice(f, nrows)).decode()
         snippet = self.reader(
             io.StringIO(head), nrows=nrows, names=names, dtype=dtype, sep=sep, header=0
         )
@@ -192,10 +433,18 @@ class CSVFileReader(GPUFileReader):
                     name = col
                 self.names.append(name)
             for i, col in enumerate(snippet._columns):
-                if estimate_row_size:
-                    self.row_size += col.dtype.itemsize
                 dtype_inf[self.names[i]] = col.dtype
+            if estimate_row_size:
+                self.row_size = _estimate_row_size(snippet)
         self.dtype = dtype or dtype_inf
+        # user-supplied dtypes are parsed straight into, saving a copy per
+        # column. Dtypes inferred from the head aren't forced on the parser,
+        # since later rows may not fit them
+        self.read_dtype = None
+        if isinstance(dtype, dict):
+            self.read_dtype = {name: _parser_dtype(dt) for name, dt in dtype.items()}
+        elif dtype:
+            self.read_dtype = dtype
 
         # Determine batch size if needed
         if batch_size:
@@ -221,11 +470,15 @@ class CSVFileReader(GPUFileReader):
                 names=self.names,
                 header=0 if chunks == 0 and self.inferred_names else None,
                 sep=self.sep,
+                dtype=self.read_dtype,
             )
 
             if self.columns:
-                for col in self.columns:
-                    chunk[col] = chunk[col].astype(self.dtype[col])
+                if self.read_dtype is None:
+                    # astype always copies, skip columns that already match
+                    for col in self.columns:
+                        if chunk[col].dtype != self.dtype[col]:
+                            chunk[col] = chunk[col].astype(self.dtype[col])
                 chunk = chunk[self.columns]
 
             yield chunk
@@ -257,7 +510,9 @@ class GPUFileIterator:
             file_path,
             columns=columns,
             batch_size=batch_size,
-            gpu_memory_frac=gpu_memory_frac,
+            # gpu_memory_frac is the budget for all the chunks that prefetching
+            # keeps on the device at once, so each chunk gets its share of it
+            gpu_memory_frac=gpu_memory_frac / (_PREFETCH_DEPTH + 2),
             use_row_groups=use_row_groups,
             dtypes=dtypes,
             names=names,
@@ -268,9 +523,13 @@ class GPUFileIterator:
         self.columns = columns
 
     def __iter__(self):
+        # the next chunk is read while the consumer works on this one
+        yield from _prefetch(self._chunks())
+
+    def _chunks(self):
         for chunk in self.engine:
             if self.dtypes:
-                self._set_dtypes(chunk)
+                self.set_dtypes(chunk)
             yield chunk
             chunk = None
 
@@ -281,9 +540,9 @@ class GPUFileIterator:
         for col, dtype in self.dtypes.items():
             if type(dtype) is str:
                 if "hex" in dtype:
-                    chunk[col] = chunk[col]._column.nvstrings.htoi()
-                    chunk[col] = chunk[col].astype(np.int32)
-            else:
+                    chunk[col] = _hex_to_int32(chunk[col])
+            elif chunk[col].dtype != dtype:
+                # astype always copies, skip columns that already match
                 chunk[col] = chunk[col].astype(dtype)
 
 
@@ -307,11 +566,16 @@ class GPUDatasetIterator:
     engine : str
         supported file types are: 'parquet' or 'csv'
     gpu_memory_frac : float
-        fraction of the GPU memory to fill
+        fraction of the free GPU memory to fill. This is the total across
+        the chunks held at once while the next ones are read ahead
+        (_PREFETCH_DEPTH + 2 of them), so each chunk is sized from that share
     batch_size : int
         number of samples in each batch
     columns :
     use_row_groups :
+    adaptive_batch_size : bool, default True
+        parquet batches sized from gpu_memory_frac are adjusted to the memory
+        the chunks actually take, which makes the chunk count an estimate
     dtypes :
     row_size: int
     """
@@ -327,8 +591,21 @@ class GPUDatasetIterator:
         self.kwargs = kwargs
 
     def __iter__(self):
-        for path in self.paths:
-            yield from GPUFileIterator(path, **self.kwargs)
+        # one prefetcher spans file boundaries, so the next file's first chunk
+        # is read while the current one is processed
+        yield from _prefetch(self._chunks())
+
+    def _chunks(self):
+        # readers are opened one file ahead: the next file's footer (or head)
+        # is read as the current one starts streaming, rather than opening
+        # every file before the first chunk
+        paths = iter(self.paths)
+        itr = GPUFileIterator(next(paths), **self.kwargs)
+        for path in paths:
+            next_itr = GPUFileIterator(path, **self.kwargs)
+            yield from itr._chunks()
+            itr = next_itr
+        yield from itr._chunks()
 
 
 class Shuffler:
@@ -377,25 +654,27 @@ class Shuffler:
 
     @annotate("add_data", color="orange", domain="nvt_python")
     def add_data(self, gdf):
-        arr = cp.arange(len(gdf))
-        cp.random.shuffle(arr)
+        # shuffle with a single gather, every slice below is then contiguous
+        gdf = gdf.iloc[cp.random.permutation(len(gdf))]
 
-        # get slice info
-        int_slice_size = gdf.shape[0] // self.num_out_files
-        slice_size = int_slice_size if gdf.shape[0] % int_slice_size == 0 else int_slice_size + 1
+        # get slice info (ceil, so that no rows are left over)
+        slice_size = max(-(-gdf.shape[0] // self.num_out_files), 1)
         np.random.shuffle(self.b_idxs)
 
         for x in range(self.num_out_files):
             start = x * slice_size
-            end = start + slice_size
-            # check if end is over length
-            end = end if end <= gdf.shape[0] else gdf.shape[0]
-            to_write = gdf.iloc[arr[start:end]]
+            if start >= gdf.shape[0]:
+                break
+            end = min(start + slice_size, gdf.shape[0])
+            # contiguous slice, no gather index needed
+            to_write = gdf.iloc[start:end]
             b_idx = self.b_idxs[x]
             self.queue.put((b_idx, to_write))
 
-        # wait for all writes to finish before exitting (so that we aren't using memory)
-        self.queue.join()
+        # don't wait for the writes to finish, so that they overlap with
+        # reading and processing the next chunk. The queue is bounded, so at
+        # most the slices of this chunk and the next one are held in memory,
+        # close() waits for whatever is still pending.
 
     def close(self):
         # wake up all the worker threads and signal for them to exit
@@ -14,19 +14,62 @@
 # limitations under the License.
 #
 
+import functools
+import inspect
 import os
 
 import cudf
+import cupy as cp
 import numpy as np
 from cudf._lib.nvtx import annotate
 
-from nvtabular.encoder import DLLabelEncoder
+from nvtabular.encoder import DLLabelEncoder, batch_transform
 from nvtabular.groupby import GroupByMomentsCal
 
 CONT = "continuous"
 CAT = "categorical"
 ALL = "all"
 
+# Operator.get_columns results for the columns context in "ctx" (held, so it
+# can't be confused with a later context), keyed by (cols_grp, target_cols)
+_columns_cache = {"ctx": None, "cols": {}}
+
+# fused cast + log(1 + x), compiled on first use
+_log1p_kernel = cp.ElementwiseKernel("T x", "float32 y", "y = log1pf((float) x)", "nvt_log1p")
+
+
+def _log1p(ser):
+    """ Returns log(1 + ser) as a float32 Series, keeping the null mask of ser """
+    col = ser._column
+    out = cp.empty(len(ser), dtype=cp.float32)
+    if len(ser):
+        _log1p_kernel(cp.asarray(col.data_array_view), out)
+    new_ser = cudf.Series(out, index=ser.index)
+    if col.has_nulls:
+        new_ser = new_ser.set_mask(col.mask)
+    return new_ser
+
+
+# fused (x - mean) / std + cast to float32
+_standardize_kernel = cp.ElementwiseKernel(
+    "T x, float64 mean, float64 std",
+    "float32 y",
+    "y = (float) ((x - mean) / std)",
+    "nvt_standardize",
+)
+
+
+def _standardize(ser, mean, std):
+    """ Returns (ser - mean) / std as a float32 Series, keeping the null mask of ser """
+    col = ser._column
+    out = cp.empty(len(ser), dtype=cp.float32)
+    if len(ser):
+        _standardize_kernel(cp.asarray(col.data_array_view), mean, std, out)
+    new_ser = cudf.Series(out, index=ser.index)
+    if col.has_nulls:
+        new_ser = new_ser.set_mask(col.mask)
+    return new_ser
+
 
 class OperatorRegistry(type):
     OPS = {}
@@ -37,6 +80,12 @@ class OperatorRegistry(type):
         return ret
 
 
+@functools.lru_cache(maxsize=None)
+def _init_params(cls):
+    """Names of the keyword arguments accepted by an operator's constructor"""
+    return frozenset(inspect.signature(cls.__init__).parameters) - {"self"}
+
+
 class Operator(metaclass=OperatorRegistry):
     """
     Base class for all operator classes.
@@ -57,15 +106,32 @@ class Operator(metaclass=OperatorRegistry):
         # burden on user to ensure columns exist in dataset (as discussed)
         if self.columns:
             return self.columns
-        tar_cols = []
-        for tar in target_cols:
-            if tar in cols_ctx[cols_grp].keys():
-                tar_cols = tar_cols + cols_ctx[cols_grp][tar]
-        return tar_cols
+        # resolved lists are cached until the columns context changes. They
+        # are stored as tuples and returned as new lists, so that callers
+        # can't alias (and mutate) the cache or the context's own lists
+        if _columns_cache["ctx"] is not cols_ctx:
+            _columns_cache["ctx"] = cols_ctx
+            _columns_cache["cols"] = {}
+        key = (cols_grp, tuple(target_cols))
+        cached = _columns_cache["cols"].get(key)
+        if cached is None:
+            cached = []
+            for tar in target_cols:
+                if tar in cols_ctx[cols_grp].keys():
+                    cached.extend(cols_ctx[cols_grp][tar])
+            cached = _columns_cache["cols"][key] = tuple(cached)
+        return list(cached)
 
     def export_op(self):
+        # only export constructor arguments, and copy containers, so that the
+        # exported state doesn't alias (and keep alive) the op's live stats
+        params = _init_params(type(self))
         export = {}
-        export[str(self._id)] = self.__dict__
+        export[str(self._id)] = {
+            key: (val.copy() if isinstance(val, (dict, list)) else val)
+            for key, val in self.__dict__.items()
+            if key in params
+        }
         return export
 
 
@@ -111,15 +177,19 @@ class TransformOperator(Operator):
 
         if not pro:
             input_cols = self.default_out
-        columns_ctx[input_cols][new_key] = []
         if self.replace and self.preprocessing:
             # not making new columns instead using old ones
             # must reference original target with new operator for chaining
-            columns_ctx[input_cols][new_key] = origin_targets
-            return
-        columns_ctx[input_cols][new_key] = list(new_cols)
-        if not self.preprocessing and self._id not in columns_ctx["final"]["ctx"][input_cols]:
-            columns_ctx["final"]["ctx"][input_cols].append(self._id)
+            new_val = origin_targets
+        else:
+            new_val = list(new_cols)
+            if not self.preprocessing and self._id not in columns_ctx["final"]["ctx"][input_cols]:
+                columns_ctx["final"]["ctx"][input_cols].append(self._id)
+                _columns_cache["cols"] = {}
+        # this runs for every chunk, only touch the context when it changes
+        if columns_ctx[input_cols].get(new_key) != new_val:
+            columns_ctx[input_cols][new_key] = new_val
+            _columns_cache["cols"] = {}
 
     def apply_op(
         self,
@@ -138,7 +208,11 @@ class TransformOperator(Operator):
         if self.replace and self.preprocessing and target_columns:
             origin_gdf[target_columns] = new_gdf
             return origin_gdf
-        return cudf.concat([origin_gdf, new_gdf], axis=1)
+        # attach the new columns in place instead of concatenating into a new frame;
+        # assigning the underlying column shares its buffer and skips index alignment
+        for col in new_gdf.columns:
+            origin_gdf[col] = new_gdf._data[col]
+        return origin_gdf
 
     def op_logic(self, gdf, target_columns, stats_context=None):
         raise NotImplementedError(
@@ -223,33 +297,43 @@ class MinMax(StatOperator):
         """ Iteration level Min Max collection, a chunk at a time
         """
         cols = self.get_columns(columns_ctx, input_cols, target_cols)
+        num_cols = [col for col in cols if gdf[col].dtype != "object"]
+        num_set = set(num_cols)
+        if num_cols:
+            # reduce all numeric columns at once (nulls are skipped), and
+            # move the results to host memory in a single transfer
+            sub = gdf[num_cols]
+            num_mins = sub.min().to_pandas()
+            num_maxs = sub.max().to_pandas()
         for col in cols:
-            gdf_col = gdf[col].dropna()
-            if gdf_col.dtype != "object":
-                col_min = gdf_col.min()
-                col_max = gdf_col.max()
+            if col in num_set:
+                col_min = num_mins[col].item()
+                col_max = num_maxs[col].item()
             else:
-                # StringColumn etc doesn't have min/max methods yet, convert
-                # to host memory and take the min there.
-                col_min = min(gdf_col.tolist())
-                col_max = max(gdf_col.tolist())
+                # StringColumn etc doesn't have min/max methods yet, sort on
+                # the device (byte order matches python's str ordering) and
+                # only copy the two ends to host memory
+                gdf_col = gdf[col].dropna().sort_values()
+                col_min = gdf_col.iloc[0]
+                col_max = gdf_col.iloc[-1]
             if col not in self.batch_mins:
                 self.batch_mins[col] = []
                 self.batch_maxs[col] = []
             self.batch_mins[col].append(col_min)
             self.batch_maxs[col].append(col_max)
+            # the per-chunk lists are kept as part of the exported stats, the
+            # result is folded in as chunks arrive rather than in read_fin
+            if col in self.mins:
+                col_min = min(self.mins[col], col_min)
+                col_max = max(self.maxs[col], col_max)
+            self.mins[col] = col_min
+            self.maxs[col] = col_max
         return
 
     @annotate("MinMax_fin", color="green", domain="nvt_python")
     def read_fin(self):
 
-        for col in self.batch_mins.keys():
-            # required for exporting values later,
-            # must move values from gpu if cupy->numpy not supported
-            self.batch_mins[col] = cudf.Series(self.batch_mins[col]).tolist()
-            self.batch_maxs[col] = cudf.Series(self.batch_maxs[col]).tolist()
-            self.mins[col] = min(self.batch_mins[col])
-            self.maxs[col] = max(self.batch_maxs[col])
+        # mins/maxs are already reduced across chunks in apply_op
         return
 
     def registered_stats(self):
@@ -282,14 +366,16 @@ class Moments(StatOperator):
     columns :
     counts : list of float, default None
     means : list of float, default None
+    m2s : list of float, default None
     varis : list of float, default None
     stds : list of float, default None
     """
 
-    def __init__(self, columns=None, counts=None, means=None, varis=None, stds=None):
+    def __init__(self, columns=None, counts=None, means=None, m2s=None, varis=None, stds=None):
         super().__init__(columns=columns)
         self.counts = counts if counts is not None else {}
         self.means = means if means is not None else {}
+        self.m2s = m2s if m2s is not None else {}
         self.varis = varis if varis is not None else {}
         self.stds = stds if stds is not None else {}
 
@@ -298,46 +384,52 @@ class Moments(StatOperator):
         self, gdf: cudf.DataFrame, columns_ctx: dict, input_cols, target_cols="base",
     ):
         """ Iteration-level moment algorithm (mean/std).
+
+        Running (count, mean, M2) statistics are merged with the chunk-level
+        ones using the parallel algorithm of Chan et al., which avoids the
+        catastrophic cancellation of the naive variance combination. The
+        variance is the sample variance (ddof=1), as it always was here.
         """
         cols = self.get_columns(columns_ctx, input_cols, target_cols)
+        if not cols:
+            return
+        # chunk-level statistics of all columns as batched reductions,
+        # each copied to host memory once
+        sub = gdf[cols]
+        counts = (len(sub) - sub.isnull().sum()).to_pandas()
+        means = sub.mean().to_pandas()
+        # sample variance (ddof=1), turned back into M2 below
+        varis = sub.var(ddof=1).to_pandas()
         for col in cols:
             if col not in self.counts:
                 self.counts[col] = 0.0
                 self.means[col] = 0.0
+                self.m2s[col] = 0.0
                 self.varis[col] = 0.0
                 self.stds[col] = 0.0
 
-            # TODO: Harden this routine to handle 0-division.
-            #       This algo may also break/overflow at scale.
-
-            n1 = self.counts[col]
-            n2 = float(len(gdf))
-
-            v1 = self.varis[col]
-            v2 = gdf[col].var()
-
-            m1 = self.means[col]
-            m2 = gdf[col].mean()
-
-            self.counts[col] += n2
-            self.means[col] = (m1 * n1 + m2 * n2) / self.counts[col]
-
-            #  Variance
-            t1 = n1 * v1
-            t2 = n2 * v2
-            t3 = n1 * ((m1 - self.means[col]) ** 2)
-            t4 = n2 * ((m2 - self.means[col]) ** 2)
-            t5 = n1 + n2
-            self.varis[col] = (t1 + t2 + t3 + t4) / t5
+            n_b = float(counts[col])
+            if n_b == 0:
+                continue
+            mean_b = float(means[col])
+            m2_b = float(varis[col]) * (n_b - 1) if n_b > 1 else 0.0
+
+            n_a = self.counts[col]
+            n_ab = n_a + n_b
+            delta = mean_b - self.means[col]
+            self.counts[col] = n_ab
+            self.means[col] += delta * n_b / n_ab
+            self.m2s[col] += m2_b + delta * delta * n_a * n_b / n_ab
         return
 
     @annotate("Moments_fin", color="green", domain="nvt_python")
     def read_fin(self):
         """ Finalize statistical-moments algorithm.
         """
-        for col in self.varis.keys():
+        for col in self.m2s.keys():
+            n = self.counts[col]
+            self.varis[col] = float(self.m2s[col] / (n - 1)) if n > 1 else 0.0
             self.stds[col] = float(np.sqrt(self.varis[col]))
-            self.varis[col] = float(self.varis[col])
             self.means[col] = float(self.means[col])
 
     def registered_stats(self):
@@ -355,6 +447,7 @@ class Moments(StatOperator):
     def clear(self):
         self.counts = {}
         self.means = {}
+        self.m2s = {}
         self.varis = {}
         self.stds = {}
         return
@@ -385,15 +478,17 @@ class Median(StatOperator):
         """ Iteration-level median algorithm.
         """
         cols = self.get_columns(columns_ctx, input_cols, target_cols)
+        if not cols:
+            return
+        # quantile is a selection (no full sort) over all columns at once
+        col_medians = gdf[cols].quantile(0.5).to_pandas()
         for name in cols:
             if name not in self.batch_medians:
                 self.batch_medians[name] = []
-            col = gdf[name].copy()
-            col = col.dropna().reset_index(drop=True).sort_values()
-            if len(col) > 1:
-                self.batch_medians[name].append(float(col[len(col) // 2]))
-            else:
-                self.batch_medians[name].append(0.0)
+            median = float(col_medians[name])
+            # all-null chunks have no median, don't let them pull towards 0
+            if not np.isnan(median):
+                self.batch_medians[name].append(median)
         return
 
     @annotate("Median_fin", color="green", domain="nvt_python")
@@ -401,8 +496,7 @@ class Median(StatOperator):
         """ Finalize median algorithm.
         """
         for col, val in self.batch_medians.items():
-            self.batch_medians[col].sort()
-            self.medians[col] = float(self.batch_medians[col][len(self.batch_medians[col]) // 2])
+            self.medians[col] = float(np.median(np.asarray(val, dtype=np.float64))) if val else 0.0
         return
 
     def registered_stats(self):
@@ -494,8 +588,6 @@ class Encoder(StatOperator):
                 else:
                     self.encoders[name] = DLLabelEncoder(name)
 
-                gdf[name].append([None])
-
             self.encoders[name].fit(gdf[name])
         return
 
@@ -585,8 +677,12 @@ class ZeroFill(TransformOperator):
         if not cont_names:
             return gdf
         z_gdf = gdf[cont_names].fillna(0)
+        # clamp negatives with one elementwise pass per column (cudf 0.14
+        # has no DataFrame.clip), there are no nulls left after fillna
+        for col in cont_names:
+            vals = cp.asarray(z_gdf[col]._column.data_array_view)
+            z_gdf[col] = cudf.Series(cp.maximum(vals, 0), index=z_gdf.index)
         z_gdf.columns = [f"{col}_{self._id}" for col in z_gdf.columns]
-        z_gdf[z_gdf < 0] = 0
         return z_gdf
 
 
@@ -611,10 +707,7 @@ class LogOp(TransformOperator):
         cont_names = target_columns
         if not cont_names:
             return gdf
-        new_gdf = np.log(gdf[cont_names].astype(np.float32) + 1)
-        new_cols = [f"{col}_{self._id}" for col in new_gdf.columns]
-        new_gdf.columns = new_cols
-        return new_gdf
+        return cudf.DataFrame({f"{col}_{self._id}": _log1p(gdf[col]) for col in cont_names})
 
 
 class Normalize(DFOperator):
@@ -634,7 +727,10 @@ class Normalize(DFOperator):
 
     @property
     def req_stats(self):
-        return [Moments()]
+        # built once per instance, so every access sees the same stat ops
+        if not hasattr(self, "_req_stats"):
+            self._req_stats = [Moments()]
+        return self._req_stats
 
     @annotate("Normalize_op", color="darkgreen", domain="nvt_python")
     def op_logic(self, gdf: cudf.DataFrame, target_columns: list, stats_context=None):
@@ -645,15 +741,17 @@ class Normalize(DFOperator):
         return gdf
 
     def apply_mean_std(self, gdf, stats_context, cont_names):
-        new_gdf = cudf.DataFrame()
-        for name in cont_names:
-            if stats_context["stds"][name] > 0:
-                new_col = f"{name}_{self._id}"
-                new_gdf[new_col] = (gdf[name] - stats_context["means"][name]) / (
-                    stats_context["stds"][name]
-                )
-                new_gdf[new_col] = new_gdf[new_col].astype("float32")
-        return new_gdf
+        # columns with zero variance can't be standardized, skip them
+        cont_names = [name for name in cont_names if stats_context["stds"][name] > 0]
+        if not cont_names:
+            return cudf.DataFrame()
+        means, stds = stats_context["means"], stats_context["stds"]
+        return cudf.DataFrame(
+            {
+                f"{name}_{self._id}": _standardize(gdf[name], means[name], stds[name])
+                for name in cont_names
+            }
+        )
 
 
 class FillMissing(DFOperator):
@@ -685,14 +783,20 @@ class FillMissing(DFOperator):
 
     @property
     def req_stats(self):
-        return []
+        if not hasattr(self, "_req_stats"):
+            self._req_stats = []
+        return self._req_stats
 
     @annotate("FillMissing_op", color="darkgreen", domain="nvt_python")
     def op_logic(self, gdf: cudf.DataFrame, target_columns: list, stats_context=None):
         cont_names = target_columns
         if not cont_names:
             return gdf
-        z_gdf = gdf[cont_names].fillna(0)
+        z_gdf = gdf[cont_names]
+        # null counts are column metadata, only fill columns that need it
+        fills = {col: self.fill_val for col in cont_names if z_gdf[col].has_nulls}
+        if fills:
+            z_gdf = z_gdf.fillna(fills)
         z_gdf.columns = [f"{col}_{self._id}" for col in z_gdf.columns]
         return z_gdf
 
@@ -717,16 +821,24 @@ class FillMedian(DFOperator):
 
     @property
     def req_stats(self):
-        return [Median()]
+        if not hasattr(self, "_req_stats"):
+            self._req_stats = [Median()]
+        return self._req_stats
 
     @annotate("FillMedian_op", color="darkgreen", domain="nvt_python")
     def op_logic(self, gdf: cudf.DataFrame, target_columns: list, stats_context=None):
         if not target_columns:
             return gdf
 
-        new_gdf = cudf.DataFrame()
-        for col in target_columns:
-            new_gdf[col] = gdf[col].fillna(stats_context["medians"][col])
+        # fill all the target columns that have nulls in a single call
+        new_gdf = gdf[target_columns]
+        medians = {
+            col: stats_context["medians"][col]
+            for col in target_columns
+            if new_gdf[col].has_nulls
+        }
+        if medians:
+            new_gdf = new_gdf.fillna(medians)
         new_gdf.columns = [f"{col}_{self._id}" for col in new_gdf.columns]
         return new_gdf
 
@@ -933,17 +1045,19 @@ class GroupBy(DFOperator):
 
     @property
     def req_stats(self):
-        return [
-            GroupByMoments(
-                cat_names=self.cat_names,
-                cont_names=self.cont_names,
-                stats=self.stats,
-                limit_frac=self.limit_frac,
-                gpu_mem_util_limit=self.gpu_mem_util_limit,
-                gpu_mem_trans_use=self.gpu_mem_trans_use,
-                order_column_name=self.order_column_name,
-            )
-        ]
+        if not hasattr(self, "_req_stats"):
+            self._req_stats = [
+                GroupByMoments(
+                    cat_names=self.cat_names,
+                    cont_names=self.cont_names,
+                    stats=self.stats,
+                    limit_frac=self.limit_frac,
+                    gpu_mem_util_limit=self.gpu_mem_util_limit,
+                    gpu_mem_trans_use=self.gpu_mem_trans_use,
+                    order_column_name=self.order_column_name,
+                )
+            ]
+        return self._req_stats
 
     def op_logic(self, gdf: cudf.DataFrame, target_columns: list, stats_context=None):
         if self.cat_names is None:
@@ -1023,30 +1137,33 @@ class Categorify(DFOperator):
 
     @property
     def req_stats(self):
-        return [
-            Encoder(
-                use_frequency=self.use_frequency,
-                freq_threshold=self.freq_threshold,
-                limit_frac=self.limit_frac,
-                gpu_mem_util_limit=self.gpu_mem_util_limit,
-                gpu_mem_trans_use=self.gpu_mem_trans_use,
-            )
-        ]
+        if not hasattr(self, "_req_stats"):
+            self._req_stats = [
+                Encoder(
+                    use_frequency=self.use_frequency,
+                    freq_threshold=self.freq_threshold,
+                    limit_frac=self.limit_frac,
+                    gpu_mem_util_limit=self.gpu_mem_util_limit,
+                    gpu_mem_trans_use=self.gpu_mem_trans_use,
+                )
+            ]
+        return self._req_stats
 
     @annotate("Categorify_op", color="darkgreen", domain="nvt_python")
     def op_logic(self, gdf: cudf.DataFrame, target_columns: list, stats_context=None):
         cat_names = target_columns
-        new_gdf = cudf.DataFrame()
         if not cat_names:
             return gdf
         cat_names = [name for name in cat_names if name in gdf.columns]
-        new_cols = []
+        encoded = batch_transform(stats_context["encoders"], gdf, cat_names)
+        # build the frame in one go, only casting codes that aren't int64 yet
+        new_cols = {}
         for name in cat_names:
-            new_col = f"{name}_{self._id}"
-            new_cols.append(new_col)
-            new_gdf[new_col] = stats_context["encoders"][name].transform(gdf[name])
-            new_gdf[new_col] = new_gdf[new_col].astype("int64")
-        return new_gdf
+            codes = encoded[name]
+            new_cols[f"{name}_{self._id}"] = (
+                codes if codes.dtype == "int64" else codes.astype("int64")
+            )
+        return cudf.DataFrame(new_cols)
 
     def get_emb_sz(self, encoders, cat_names):
         # sorted key required to ensure same sort occurs for all values
@@ -147,7 +147,8 @@ class KerasSequenceDataset(tf.keras.utils.Sequence):
       Whether to shuffle chunks of batches before iterating through them.
   - buffer_size: float or int
       If `0 <  buffer_size < 1`, `buffer_size` will refer to the amount of
-      free GPU memory to occupy with a buffered chunk. If `1 < buffer_size <
+      free GPU memory to occupy with buffered chunks, which is shared by
+      the chunks held while the next ones are read ahead. If `1 < buffer_size <
       batch_size`, the number of rows read for a buffered chunk will
       be equal to `int(buffer_size*batch_size)`. Otherwise, if `buffer_size >
       batch_size`, `buffer_size` rows will be read in each chunk (except for
@@ -176,7 +177,7 @@ class KerasSequenceDataset(tf.keras.utils.Sequence):
         shuffle=True,
         buffer_size=10,
         dataset_size=None,
-        reader_kwargs={},
+        reader_kwargs=None,
     ):
         # use tf glob to find matching files
         if isinstance(file_pattern, str):
@@ -207,6 +208,10 @@ class KerasSequenceDataset(tf.keras.utils.Sequence):
                 "feature_columns or list of all strings. Got {}".format(columns)
             )
 
+        # copy so that the caller's (or a shared default) dict isn't
+        # mutated and leaked into other dataset instances
+        reader_kwargs = dict(reader_kwargs or {})
+
         # intialize the dataset iterator with a batch_size increased
         # by buffer_factor to do as few loads as possible
         # TODO: what's the syntax for byte range read?
@@ -15,6 +15,7 @@
 #
 
 import cudf
+import cupy as cp
 import torch
 from torch.utils.dlpack import from_dlpack
 
@@ -25,6 +26,8 @@ class FileItrDataset(torch.utils.data.IterableDataset):
     gpu_itr = None
 
     def __init__(self, file, **kwargs):
+        # the dataset's length has to match the chunks it yields
+        kwargs.setdefault("adaptive_batch_size", False)
         self.gpu_itr = GPUFileIterator(file, **kwargs)
 
     def __iter__(self):
@@ -102,57 +105,95 @@ class TensorItr:
         self.tensors = [tensor[idx] for tensor in self.tensors]
 
 
+_copy_stream = None
+
+
+def _get_copy_stream():
+    global _copy_stream
+    if _copy_stream is None:
+        _copy_stream = torch.cuda.Stream()
+    return _copy_stream
+
+
+def _sync_copies():
+    """ Waits for all pending device to host copies started by _to_host """
+    if _copy_stream is not None:
+        _copy_stream.synchronize()
+
+
+def _to_host(t):
+    """
+    Starts an asynchronous copy of the device tensor `t` into pinned host
+    memory on a side stream, so the copy can overlap with the processing
+    of the next chunk. Call `_sync_copies` before reading the result.
+    """
+    stream = _get_copy_stream()
+    stream.wait_stream(torch.cuda.current_stream())
+    # pinned allocations are served (and reused) by torch's caching host allocator
+    host = torch.empty(t.shape, dtype=t.dtype, pin_memory=True)
+    with torch.cuda.stream(stream):
+        host.copy_(t, non_blocking=True)
+    t.record_stream(stream)
+    return host
+
+
 def _to_tensor(gdf: cudf.DataFrame, dtype, tensor_list, to_cpu=False):
     if gdf.empty:
         return
-    for column in gdf.columns:
-        gdf_col = gdf[column]
-        g = gdf_col.to_dlpack()
-        t = from_dlpack(g).type(dtype)
-        t = t.to(torch.device("cpu")) if to_cpu else t
-        tensor_list[column] = (
-            t if column not in tensor_list else torch.cat([tensor_list[column], t])
-        )
-        del g
+    # a single dlpack handoff for the whole (rows x columns) submatrix
+    arr = cp.asarray(gdf.as_gpu_matrix())
+    t = from_dlpack(arr.toDlpack()).type(dtype)
+    t = _to_host(t) if to_cpu else t
+    # chunks are concatenated once, in combine_tensors
+    tensor_list.append(t)
 
 
-def create_tensors(preproc, itr=None, gdf=None, apply_ops=True):
-    cats, conts, label = {}, {}, {}
+def create_tensors(preproc, itr=None, gdf=None, apply_ops=True, to_cpu=False):
+    cats, conts, label = [], [], []
     if itr:
         for gdf in itr:
-            process_one_df(gdf, cats, conts, label, preproc=preproc, apply_ops=apply_ops)
+            process_one_df(
+                gdf, cats, conts, label, preproc=preproc, apply_ops=apply_ops, to_cpu=to_cpu
+            )
     elif gdf:
-        process_one_df(gdf, cats, conts, label, preproc=preproc, apply_ops=apply_ops)
+        process_one_df(
+            gdf, cats, conts, label, preproc=preproc, apply_ops=apply_ops, to_cpu=to_cpu
+        )
     return combine_tensors(cats, conts, label)
 
 
-def create_tensors_plain(gdf, cat_cols, cont_cols, label_cols):
-    cats, conts, label = {}, {}, {}
+def create_tensors_plain(gdf, cat_cols, cont_cols, label_cols, to_cpu=False):
+    cats, conts, label = [], [], []
     _one_df(
-        gdf, cats, conts, label, cat_names=cat_cols, cont_names=cont_cols, label_names=label_cols
+        gdf,
+        cats,
+        conts,
+        label,
+        cat_names=cat_cols,
+        cont_names=cont_cols,
+        label_names=label_cols,
+        to_cpu=to_cpu,
     )
     return combine_tensors(cats, conts, label)
 
 
 def combine_tensors(cats, conts, label):
-    cats_list = (
-        [cats[x] for x in sorted(cats.keys(), key=lambda entry: entry.split("_")[0])]
-        if cats
-        else None
-    )
-    conts_list = [conts[x] for x in sorted(conts.keys())] if conts else None
-    label_list = [label[x] for x in sorted(label.keys())] if label else None
-
-    # Change cats, conts to dim=1 for column dim=0 for df sub section
-    cats = torch.stack(cats_list, dim=1) if len(cats_list) > 0 else None
-    conts = torch.stack(conts_list, dim=1) if len(conts_list) > 0 else None
-    label = torch.cat(label_list, dim=0) if len(label_list) > 0 else None
+    _sync_copies()
+    # chunks hold (rows x columns) tensors, already in column order
+    cats = torch.cat(cats) if cats else None
+    conts = torch.cat(conts) if conts else None
+    # labels are returned one column after the other, in a single dim
+    label = torch.cat(label).t().reshape(-1) if label else None
     return cats, conts, label
 
 
 def _one_df(
-    gdf, cats, conts, label, cat_names=None, cont_names=None, label_names=None,
+    gdf, cats, conts, label, cat_names=None, cont_names=None, label_names=None, to_cpu=False,
 ):
+    # order the columns the same way get_final_cols does
+    cat_names = sorted(cat_names, key=lambda entry: entry.split("_")[0])
+    cont_names = sorted(cont_names)
+    label_names = sorted(label_names)
     gdf_cats, gdf_conts, gdf_label = (
         gdf[cat_names],
         gdf[cont_names],
@@ -160,11 +201,11 @@ def _one_df(
     )
     del gdf
     if len(gdf_cats) > 0:
-        _to_tensor(gdf_cats, torch.long, cats, to_cpu=False)
+        _to_tensor(gdf_cats, torch.long, cats, to_cpu=to_cpu)
     if len(gdf_conts) > 0:
-        _to_tensor(gdf_conts, torch.float32, conts, to_cpu=False)
+        _to_tensor(gdf_conts, torch.float32, conts, to_cpu=to_cpu)
     if len(gdf_label) > 0:
-        _to_tensor(gdf_label, torch.float32, label, to_cpu=False)
+        _to_tensor(gdf_label, torch.float32, label, to_cpu=to_cpu)
 
 
 def get_final_cols(preproc):
@@ -188,6 +229,7 @@ def process_one_df(
     cont_names=None,
     label_names=None,
     apply_ops=True,
+    to_cpu=False,
 ):
     if apply_ops and preproc:
         gdf = preproc.apply_ops(gdf)
@@ -203,6 +245,7 @@ def process_one_df(
         cat_names=cat_names,
         cont_names=cont_names,
         label_names=label_names,
+        to_cpu=to_cpu,
     )
 
 
@@ -230,6 +273,8 @@ class TorchTensorBatchFileItr(torch.utils.data.IterableDataset):
         self.cat_cols = cats
         self.cont_cols = conts
         self.label_cols = labels
+        # num_chunks has to match the chunks the reader yields
+        kwargs.setdefault("adaptive_batch_size", False)
         self.itr = GPUFileIterator(path, **kwargs)
         self.batch_size = sub_batch_size
         self.num_chunks = len(self.itr.engine)
@@ -247,14 +292,18 @@ class DLCollator:
     transform = None
     preproc = None
     apply_ops = True
+    to_cpu = False
 
-    def __init__(self, transform=create_tensors, preproc=None, apply_ops=True):
+    def __init__(self, transform=create_tensors, preproc=None, apply_ops=True, to_cpu=False):
         self.transform = transform
         self.preproc = preproc
         self.apply_ops = apply_ops
+        # batches stay on the GPU unless host (pinned) copies are asked for
+        self.to_cpu = to_cpu
 
     def gdf_col(self, gdf):
-        batch = self.transform(self.preproc, gdf=gdf[0], apply_ops=self.apply_ops)
+        kwargs = {"to_cpu": True} if self.to_cpu else {}
+        batch = self.transform(self.preproc, gdf=gdf[0], apply_ops=self.apply_ops, **kwargs)
         return (batch[0], batch[1]), batch[2].long()
 
 
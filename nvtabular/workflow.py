@@ -19,6 +19,7 @@ import time
 import warnings
 
 import cudf
+import cupy as cp
 import yaml
 from cudf._lib.nvtx import annotate
 
@@ -27,14 +28,14 @@ from nvtabular.encoder import DLLabelEncoder
 from nvtabular.io import HugeCTR, Shuffler
 from nvtabular.ops import DFOperator, Export, OperatorRegistry, StatOperator, TransformOperator
 
-try:
-    import cupy as cp
-except ImportError:
-    import numpy as cp
-
 
 LOG = logging.getLogger("nvtabular")
 
+# prefer the libyaml backed (C) safe dumper/loader when available, the stats of
+# large categorical columns make for big files
+_YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 class Workflow:
 
@@ -63,6 +64,11 @@ class Workflow:
     config : bool
     export : bool, default False
     export_path : str, default "./ds_export"
+    cont_dtype : str, default None
+        If set (e.g. "float32"), float64 continuous columns are cast to
+        this dtype as each chunk is read. The continuous ops are memory
+        bound, so a narrower dtype speeds them up at the cost of precision
+        in both the collected statistics and the output.
     """
 
     def __init__(
@@ -77,6 +83,7 @@ class Workflow:
         config=None,
         export=False,
         export_path="./ds_export",
+        cont_dtype=None,
     ):
         self.reg_funcs = {
             StatOperator: self.reg_stat_ops,
@@ -97,11 +104,13 @@ class Workflow:
         self.feat_ops = {}
         self.stat_ops = {}
         self.df_ops = {}
+        self._phase_plans = {}
         self.stats = {}
         self.task_sets = {}
         self.ds_exports = export_path
         self.to_cpu = to_cpu
         self.export = export
+        self.cont_dtype = cont_dtype
         self.ops_args = {}
         self.current_file_num = 0
         self.timings = {
@@ -284,6 +293,7 @@ class Workflow:
         """
         for feat_op in feat_ops:
             self.feat_ops[feat_op._id] = feat_op
+        self._phase_plans = {}
 
     def reg_df_ops(self, df_ops):
         """
@@ -293,6 +303,7 @@ class Workflow:
             dfop_id, dfop_rs = df_op._id, df_op.req_stats
             self.reg_stat_ops(dfop_rs)
             self.df_ops[dfop_id] = df_op
+        self._phase_plans = {}
 
     def reg_stat_ops(self, stat_ops):
         """
@@ -301,10 +312,10 @@ class Workflow:
         for stat_op in stat_ops:
             # pull stats, ensure no duplicates
             for stat in stat_op.registered_stats():
-                if stat not in self.stats:
-                    self.stats[stat] = {}
+                self.stats.setdefault(stat, {})
             # add actual statistic operator, after all stats added
             self.stat_ops[stat_op._id] = stat_op
+        self._phase_plans = {}
 
     def write_to_dataset(self, path, itr, apply_ops=False, nfiles=1, shuffle=True, **kwargs):
         """ Write data to shuffled parquet dataset.
@@ -359,17 +370,12 @@ class Workflow:
         for task in task_list:
             added = False
 
-            cols_needed = task[2].copy()
-            if "base" in cols_needed:
-                cols_needed.remove("base")
+            cols_needed = set(task[2]) - {"base"}
             for idx, phase in enumerate(self.phases):
                 if added:
                     break
-                for p_task in phase:
-                    if not cols_needed:
-                        break
-                    if p_task[0]._id in cols_needed:
-                        cols_needed.remove(p_task[0]._id)
+                if cols_needed:
+                    cols_needed -= {p_task[0]._id for p_task in phase}
                 if not cols_needed and self.find_parents(task[3], idx):
                     added = True
                     phase.append(task)
@@ -397,17 +403,9 @@ class Workflow:
         """
         Attempt to find all ops in ops_list within subrange of phases
         """
-        ops_copy = ops_list.copy()
-        for op in ops_list:
-            for phase in self.phases[:phase_idx]:
-                if not ops_copy:
-                    break
-                for task in phase:
-                    if not ops_copy:
-                        break
-                    if op._id in task[0]._id:
-                        ops_copy.remove(op)
-        if not ops_copy:
+        # exact id matches, "GroupBy" must not be satisfied by "GroupByMoments"
+        found = {task[0]._id for phase in self.phases[:phase_idx] for task in phase}
+        if all(op._id in found for op in ops_list):
             return True
 
     def sort_task_types(self, master_list):
@@ -488,22 +486,15 @@ class Workflow:
         # task (operator, main_columns_class, col_sub_key,  required_operators)
         for task in self.task_sets["PP"]:
             # an operator cannot exist twice
-            if not task[1] in final.keys():
-                final[task[1]] = []
+            refs = final.setdefault(task[1], [])
             # detect incorrect dependency loop
-            for x in final[task[1]]:
-                if x in task[2]:
-                    final[task[1]].remove(x)
+            if task[2]:
+                refs[:] = [x for x in refs if x not in task[2]]
             # stats dont create columns so id would not be in columns ctx
             if not task[0].__class__.__base__ == StatOperator:
-                final[task[1]].append(task[0]._id)
+                refs.append(task[0]._id)
         # add labels too specific because not specifically required in init
-        final["label"] = []
-        for p_set, col_ctx in self.columns_ctx["label"].items():
-            if not final["label"]:
-                final["label"] = col_ctx
-            else:
-                final["label"] = final["label"] + col_ctx
+        final["label"] = [col for col_ctx in self.columns_ctx["label"].values() for col in col_ctx]
         # if no operators run in preprocessing we grab base columns
         if "continuous" not in final:
             # set base columns
@@ -524,19 +515,14 @@ class Workflow:
         # still adding double need to stop that
         final_ctx = {}
         for key, ctx_list in self.columns_ctx["final"]["ctx"].items():
-            to_add = None
-            for ctx in ctx_list:
-                if ctx not in self.columns_ctx[key].keys():
-                    ctx = "base"
-                to_add = (
-                    self.columns_ctx[key][ctx]
-                    if not to_add
-                    else to_add + self.columns_ctx[key][ctx]
-                )
-            if key not in final_ctx.keys():
-                final_ctx[key] = to_add
-            else:
-                final_ctx[key] = final_ctx[key] + to_add
+            if not ctx_list:
+                final_ctx[key] = None
+                continue
+            key_ctx = self.columns_ctx[key]
+            # flatten in one pass instead of concatenating lists repeatedly
+            final_ctx[key] = [
+                col for ctx in ctx_list for col in key_ctx[ctx if ctx in key_ctx else "base"]
+            ]
         self.columns_ctx["final"]["cols"] = final_ctx
 
     def get_final_cols_names(self, col_type):
@@ -617,26 +603,26 @@ class Workflow:
         cols: str
             one of the following; continuous, categorical, all
         """
-        for task_d in self.master_task_list:
-            if op._id in task_d[0]._id and cols == task_d[1]:
-                return True
-        return False
+        # (op id, cols) pairs of the master task list, rebuilt when it changes
+        tasks = self.master_task_list
+        cached = getattr(self, "_master_task_keys", None)
+        if cached is None or cached[0] is not tasks or cached[1] != len(tasks):
+            keys = {(task_d[0]._id, task_d[1]) for task_d in tasks}
+            cached = self._master_task_keys = (tasks, len(tasks), keys)
+        return (op._id, cols) in cached[2]
 
-    def run_ops_for_phase(self, gdf, tasks, record_stats=True):
+    def run_ops_for_phase(self, gdf, tasks, record_stats=True, stats_only=False):
         run_stat_ops = []
-        for task in tasks:
-            op, cols_grp, target_cols, parents = task
+        plan = self._phase_plan(tasks, record_stats, stats_only=stats_only)
+        for kind, op, cols_grp, target_cols in plan:
             LOG.debug("running op %s", op._id)
-            if record_stats and op._id in self.stat_ops:
-                op = self.stat_ops[op._id]
+            if kind == "stat":
                 op.apply_op(gdf, self.columns_ctx, cols_grp, target_cols=target_cols)
                 run_stat_ops.append(op) if op not in run_stat_ops else None
-            elif op._id in self.feat_ops:
-                gdf = self.feat_ops[op._id].apply_op(
-                    gdf, self.columns_ctx, cols_grp, target_cols=target_cols
-                )
-            elif op._id in self.df_ops:
-                gdf = self.df_ops[op._id].apply_op(
+            elif kind == "feat":
+                gdf = op.apply_op(gdf, self.columns_ctx, cols_grp, target_cols=target_cols)
+            else:
+                gdf = op.apply_op(
                     gdf,
                     self.columns_ctx,
                     cols_grp,
@@ -645,6 +631,33 @@ class Workflow:
                 )
         return gdf, run_stat_ops
 
+    def _phase_plan(self, tasks, record_stats, stats_only=False):
+        """
+        Resolves the registered operator for every task of a phase. Phases
+        run once per chunk, so the resolved list is kept until operators
+        are registered again. With stats_only, the transforms following the
+        last statistics operator are dropped, their output is not needed to
+        collect the statistics.
+        """
+        key = (id(tasks), record_stats, stats_only)
+        cached = self._phase_plans.get(key)
+        if cached is not None and cached[0] is tasks:
+            return cached[1]
+        plan = []
+        for task in tasks:
+            op, cols_grp, target_cols, parents = task
+            if record_stats and op._id in self.stat_ops:
+                plan.append(("stat", self.stat_ops[op._id], cols_grp, target_cols))
+            elif op._id in self.feat_ops:
+                plan.append(("feat", self.feat_ops[op._id], cols_grp, target_cols))
+            elif op._id in self.df_ops:
+                plan.append(("df", self.df_ops[op._id], cols_grp, target_cols))
+        if stats_only:
+            kinds = [entry[0] for entry in plan]
+            plan = plan[: len(kinds) - kinds[::-1].index("stat")] if "stat" in kinds else []
+        self._phase_plans[key] = (tasks, plan)
+        return plan
+
     # run phase
     def exec_phase(
         self,
@@ -662,7 +675,14 @@ class Workflow:
         """
         LOG.debug("running phase %s", phase_index)
         stat_ops_ran = []
+        # the output of any phase but the last one is thrown away, so only
+        # run it as far as needed to collect its statistics (if any)
+        stats_only = phase_index < len(self.phases) - 1
+        if stats_only and not self._phase_plan(self.phases[phase_index], record_stats, True):
+            self.get_stats()
+            return
         for gdf in itr:
+            gdf = self._cast_conts(gdf)
             # run all previous phases to get df to correct state
             start = time.time()
             for i in range(phase_index):
@@ -670,7 +690,7 @@ class Workflow:
             self.timings["preproc_reapply"] += time.time() - start
             start = time.time()
             gdf, stat_ops_ran = self.run_ops_for_phase(
-                gdf, self.phases[phase_index], record_stats=record_stats
+                gdf, self.phases[phase_index], record_stats=record_stats, stats_only=stats_only
             )
             self.timings["preproc_apply"] += time.time() - start
 
@@ -807,6 +827,8 @@ class Workflow:
         # run the PP ops
         start = start_phase if start_phase else 0
         end = end_phase if end_phase else len(self.phases)
+        if start == 0:
+            gdf = self._cast_conts(gdf)
         for phase_index in range(start, end):
             start = time.time()
             gdf, stat_ops_ran = self.run_ops_for_phase(
@@ -829,6 +851,14 @@ class Workflow:
 
         return gdf
 
+    def _cast_conts(self, gdf):
+        if not self.cont_dtype:
+            return gdf
+        for col in self.columns_ctx["continuous"]["base"]:
+            if gdf[col].dtype == "float64":
+                gdf[col] = gdf[col].astype(self.cont_dtype)
+        return gdf
+
     @annotate("Write_df", color="red", domain="nvt_python")
     def write_df(self, gdf, export_path, shuffler, num_out_files):
         if shuffler:
@@ -842,13 +872,12 @@ class Workflow:
             self.current_file_num += 1
 
     def get_stats(self):
-        for name, stat_op in self.stat_ops.items():
-            stat_vals = stat_op.stats_collected()
-            for name, stat in stat_vals:
+        for stat_op in self.stat_ops.values():
+            for name, stat in stat_op.stats_collected():
                 if name in self.stats:
                     self.stats[name] = stat
                 else:
-                    warnings.warn("stat not found,", name)
+                    warnings.warn(f"stat not found, {name}")
 
     def save_stats(self, path):
         main_obj = {}
@@ -856,7 +885,8 @@ class Workflow:
         stats_drop["encoders"] = {}
         encoders = self.stats.get("encoders", {})
         for name, enc in encoders.items():
-            stats_drop["encoders"][name] = (enc.get_cats().values_to_string(),)
+            # categories are already held on the host, no device round-trip
+            stats_drop["encoders"][name] = (enc._cats_host.tolist(),)
         for name, stat in self.stats.items():
             if name not in stats_drop.keys():
                 stats_drop[name] = stat
@@ -867,11 +897,11 @@ class Workflow:
         for task in self.master_task_list:
             tasks.append([task[0]._id, task[1], task[2], [x._id for x in task[3]]])
             op = self.find_op(task[0]._id)
-            op_args[op._id] = op.__dict__
+            op_args[op._id] = op.export_op()[op._id]
         main_obj["op_args"] = op_args
         main_obj["tasks"] = tasks
         with open(path, "w") as outfile:
-            yaml.safe_dump(main_obj, outfile, default_flow_style=False)
+            yaml.dump(main_obj, outfile, Dumper=_YamlDumper, default_flow_style=False)
 
     def load_stats(self, path):
         def _set_stats(self, stats_dict):
@@ -879,7 +909,7 @@ class Workflow:
                 self.stats[key] = stat
 
         with open(path, "r") as infile:
-            main_obj = yaml.safe_load(infile)
+            main_obj = yaml.load(infile, Loader=_YamlLoader)
             _set_stats(self, main_obj["stats"])
             self.master_task_list = self.recreate_master_task_list(
                 main_obj["tasks"], main_obj["op_args"]
@@ -891,17 +921,17 @@ class Workflow:
         self.reg_all_ops(self.master_task_list)
 
     def clear_stats(self):
-
-        for stat, vals in self.stats.items():
+        # reset in place, the stats dict is handed to operators as their context
+        for stat in self.stats:
             self.stats[stat] = {}
 
-        for statop_id, stat_op in self.stat_ops.items():
+        for stat_op in self.stat_ops.values():
             stat_op.clear()
 
-    def ds_to_tensors(self, itr, apply_ops=True):
+    def ds_to_tensors(self, itr, apply_ops=True, to_cpu=False):
         from nvtabular.torch_dataloader import create_tensors
 
-        return create_tensors(self, itr=itr, apply_ops=apply_ops)
+        return create_tensors(self, itr=itr, apply_ops=apply_ops, to_cpu=to_cpu)
 
     def recreate_master_task_list(self, task_list, op_args):
         master_list = []
@@ -952,8 +982,5 @@ def get_new_list_config():
 
 
 def _shuffle_part(gdf):
-    sort_key = "__sort_index__"
-    arr = cp.arange(len(gdf))
-    cp.random.shuffle(arr)
-    gdf[sort_key] = cudf.Series(arr)
-    return gdf.sort_values(sort_key).drop(columns=[sort_key])
+    # a single gather by a random permutation, no sort key column needed
+    return gdf.iloc[cp.random.permutation(len(gdf))]
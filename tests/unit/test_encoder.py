@@ -79,3 +79,18 @@ def test_encoder_off_by_one(values, use_frequency):
     transformed = enc.transform(values)
     assert len(transformed) == len(values)
     assert set(transformed.tolist()) == {1, 2, 3, 4}
+
+
+def test_encoder_batch_transform():
+    gdf = cudf.DataFrame(
+        {"a": ["x", "y", None, "z", "x"], "b": ["y", "q", "q", None, "z"], "c": [1, 2, 3, 1, 5]}
+    )
+    encoders = {}
+    for name in gdf.columns:
+        encoders[name] = encoder.DLLabelEncoder(name)
+        encoders[name].fit(gdf[name].iloc[:3])
+        encoders[name].fit_finalize()
+
+    encoded = encoder.batch_transform(encoders, gdf, list(gdf.columns))
+    for name in gdf.columns:
+        assert encoded[name].tolist() == encoders[name].transform(gdf[name]).tolist()
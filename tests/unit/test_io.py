@@ -15,10 +15,13 @@
 #
 
 import glob
+import threading
 
 import cudf
+import numpy as np
 import pytest
 
+import nvtabular.ds_writer
 import nvtabular.io
 from tests.conftest import allcols_csv, mycols_csv, mycols_pq
 
@@ -42,3 +45,86 @@ def test_shuffle_gpu(tmpdir, datasets, engine):
         df3 = cudf.read_parquet(writer_files[0])[mycols_csv]
         df4 = cudf.read_parquet(writer_files[1])[mycols_csv]
     assert df1.shape[0] == df3.shape[0] + df4.shape[0]
+
+
+@pytest.mark.parametrize(
+    "rg_rows,max_rows,expected",
+    [
+        ([10, 10, 10, 50, 5, 5], 25, [(0, 2), (2, 1), (3, 1), (4, 2)]),
+        ([3, 3, 3], 9, [(0, 3)]),
+        ([100], 5, [(0, 1)]),
+        ([], 5, []),
+    ],
+)
+def test_pack_row_groups(rg_rows, max_rows, expected):
+    assert nvtabular.io._pack_row_groups(rg_rows, max_rows) == expected
+
+
+def test_prefetch_stops_early():
+    read, closed = [], threading.Event()
+
+    def chunks():
+        try:
+            for i in range(100):
+                read.append(i)
+                yield i
+        finally:
+            closed.set()
+
+    itr = nvtabular.io._prefetch(chunks())
+    assert [next(itr), next(itr)] == [0, 1]
+    itr.close()
+    # the reader thread stops (and closes the source) rather than reading on
+    assert closed.wait(timeout=60)
+    assert len(read) < 100
+
+
+def test_hex_to_int32():
+    ser = cudf.Series(["ff", None, "0x1f", "aB", "7FFFFFFF", "zz", "10"])
+    expected = [255, 0, 0, 171, 2 ** 31 - 1, 0, 16]
+    assert nvtabular.io._hex_to_int32(ser).to_array().tolist() == expected
+    # a slice has to decode its own rows, not the head of its parent
+    assert nvtabular.io._hex_to_int32(ser[2:]).to_array().tolist() == expected[2:]
+
+
+def test_csv_reader_numpy_dtypes(tmpdir):
+    fn = str(tmpdir.join("data.csv"))
+    cudf.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]}).to_csv(fn, index=False)
+    dtype = {"a": np.float32, "b": object}
+    reader = nvtabular.io.CSVFileReader(fn, 0.5, None, dtype=dtype)
+    assert reader.read_dtype == {"a": "float32", "b": "str"}
+    gdf = cudf.concat(list(reader))
+    assert gdf["a"].dtype == "float32"
+    assert gdf["b"].dtype == "object"
+    assert gdf["b"].to_pandas().tolist() == ["x", "y", "z"]
+
+
+def test_dataset_writer_close(tmpdir):
+    df = cudf.DataFrame({"x": list(range(100)), "y": [0.5] * 100})
+    writer = nvtabular.ds_writer.DatasetWriter(str(tmpdir), nfiles=2, row_group_size=10)
+    writer.write(df)
+    writer.write(df)
+    writer.write_metadata()
+    assert writer.closed
+    # closing again (or on garbage collection) is a no-op
+    writer.close_writers()
+    writer.__del__()
+    assert sum(len(cudf.read_parquet(fn)) for fn in writer.file_names) == 200
+
+
+def test_pq_reader_len(tmpdir):
+    fn = str(tmpdir.join("data.parquet"))
+    cudf.DataFrame({"x": list(range(100)), "y": [0.5] * 100}).to_parquet(fn)
+    reader = nvtabular.io.PQFileReader(fn, 0.5, None, use_row_groups=False)
+    assert reader.adaptive
+    len(reader)
+    # asking for the length doesn't change how the reader sizes its chunks
+    assert reader.adaptive
+
+    reader = nvtabular.io.PQFileReader(
+        fn, 0.5, None, use_row_groups=False, adaptive_batch_size=False
+    )
+    assert not reader.adaptive
+    reader.batch_size = 7
+    assert len(reader) == 15
+    assert [len(gdf) for gdf in reader] == [7] * 14 + [2]
@@ -79,6 +79,10 @@ def test_minmax(tmpdir, datasets, gpu_memory_frac, engine, op_columns):
     assert x_min == pytest.approx(processor.stats["mins"]["x"], 1e-2)
     x_max = df["x"].max()
     assert x_max == pytest.approx(processor.stats["maxs"]["x"], 1e-2)
+    # the per-chunk values are exported alongside the result
+    assert isinstance(processor.stats["batch_mins"]["x"], list)
+    assert min(processor.stats["batch_mins"]["x"]) == processor.stats["mins"]["x"]
+    assert max(processor.stats["batch_maxs"]["x"]) == processor.stats["maxs"]["x"]
     if not op_columns:
         name_min = min(df["name-string"].tolist())
         name_max = max(df["name-string"].tolist())
@@ -322,3 +326,71 @@ def test_fill_missing(tmpdir, datasets, engine="parquet"):
 
     transformed = cudf.concat([op.apply_op(df, columns_ctx, "continuous") for df in data_itr])
     assert_eq(transformed[cont_names], df[cont_names].dropna(42))
+
+
+@pytest.mark.parametrize("offset", [0.0, 1e9])
+def test_moments_chunked(offset):
+    df = cudf.DataFrame({"x": np.random.rand(1000) + offset})
+    df["x"].iloc[3] = None
+
+    columns_ctx = {}
+    columns_ctx["continuous"] = {}
+    columns_ctx["continuous"]["base"] = ["x"]
+
+    op = ops.Moments()
+    for i in range(0, len(df), 100):
+        op.apply_op(df.iloc[i : i + 100], columns_ctx, "continuous")
+    op.read_fin()
+
+    values = df["x"].dropna().to_array()
+    assert op.counts["x"] == len(values)
+    assert math.isclose(np.mean(values), op.means["x"], rel_tol=1e-8)
+    # stds are sample standard deviations
+    assert math.isclose(np.std(values, ddof=1), op.stds["x"], rel_tol=1e-4)
+    assert not math.isclose(np.std(values, ddof=0), op.stds["x"], rel_tol=1e-5)
+
+
+@pytest.mark.parametrize("op_cls", [ops.Normalize, ops.FillMedian, ops.Categorify])
+def test_req_stats_cached(op_cls):
+    op = op_cls()
+    assert op.req_stats is op.req_stats
+    # cached stats must not leak into the exported constructor arguments
+    assert "_req_stats" not in op.export_op()[op._id]
+    assert op_cls(**op.export_op()[op._id]).req_stats is not op.req_stats
+
+
+@pytest.mark.parametrize("op_cls", [ops.MinMax, ops.Encoder, ops.GroupByMoments])
+def test_export_op(op_cls):
+    op = op_cls()
+    exported = op.export_op()[op._id]
+    # exported arguments rebuild the op, and don't alias its live state
+    new_op = op_cls(**exported)
+    for key, val in exported.items():
+        if isinstance(val, (dict, list)):
+            assert val is not getattr(op, key)
+            assert getattr(new_op, key) is not getattr(op, key)
+
+
+def test_log_nulls():
+    df = cudf.DataFrame({"x": [0, 1, None, 1000], "y": [0.5, None, 2.0, 3.0]})
+    columns_ctx = {"continuous": {"base": ["x", "y"]}}
+
+    new_gdf = ops.LogOp().apply_op(df.copy(), columns_ctx, "continuous")
+    for col in ["x", "y"]:
+        assert new_gdf[col].dtype == "float32"
+        assert new_gdf[col].null_count == 1
+        expect = np.log1p(df[col].to_pandas().astype(np.float32))
+        np.testing.assert_allclose(new_gdf[col].to_pandas(), expect, rtol=1e-6)
+
+
+def test_normalize_nulls():
+    df = cudf.DataFrame({"x": [1, 2, None, 5], "y": [0.5, 1.5, 2.0, 3.0]})
+    columns_ctx = {"continuous": {"base": ["x", "y"]}}
+    stats = {"means": {"x": 2.0, "y": 1.0}, "stds": {"x": 2.0, "y": 0.5}}
+
+    new_gdf = ops.Normalize().apply_op(df.copy(), columns_ctx, "continuous", stats_context=stats)
+    for col in ["x", "y"]:
+        assert new_gdf[col].dtype == "float32"
+        assert new_gdf[col].null_count == df[col].null_count
+        expect = (df[col].to_pandas() - stats["means"][col]) / stats["stds"][col]
+        np.testing.assert_allclose(new_gdf[col].to_pandas(), expect, rtol=1e-6)
@@ -301,3 +301,29 @@ def test_gpu_dl(tmpdir, datasets, batch_size, gpu_memory_frac, engine):
     assert rows == num_rows
     if os.path.exists(output_train):
         shutil.rmtree(output_train)
+
+
+@pytest.mark.parametrize("to_cpu", [True, False, None])
+def test_create_tensors_to_cpu(to_cpu):
+    df = cudf.DataFrame(
+        {
+            "cat": [1, 2, 3, 4],
+            "x": [0.5, 1.5, 2.5, 3.5],
+            "y": [1.0, 2.0, 3.0, 4.0],
+            "label": [0, 1, 0, 1],
+        }
+    )
+
+    def transform(preproc, gdf=None, apply_ops=True, **kwargs):
+        return torch_dataloader.create_tensors_plain(gdf, ["cat"], ["x", "y"], ["label"], **kwargs)
+
+    # batches stay on the GPU unless host copies are explicitly asked for
+    kwargs = {} if to_cpu is None else {"to_cpu": to_cpu}
+    collator = torch_dataloader.DLCollator(transform=transform, **kwargs)
+    (cats, conts), label = collator.gdf_col([df])
+    device = "cpu" if to_cpu else "cuda"
+    for tensor in (cats, conts, label):
+        assert tensor.device.type == device
+    np.testing.assert_array_equal(cats.cpu().numpy()[:, 0], [1, 2, 3, 4])
+    np.testing.assert_allclose(conts.cpu().numpy(), df[["x", "y"]].to_pandas().values)
+    np.testing.assert_array_equal(label.cpu().numpy(), [0, 1, 0, 1])
@@ -400,3 +400,41 @@ def test_gpu_workflow_config(tmpdir, datasets, dump, gpu_memory_frac, engine, re
     num_rows, num_row_groups, col_names = cudf.io.read_parquet_metadata(str(tmpdir) + "/_metadata")
     assert num_rows == len(df_pp)
     return processor.ds_exports
+
+
+@cleanup
+def test_gpu_workflow_cont_dtype(tmpdir):
+    # 2**24 + 1 isn't representable in float32 (it rounds to 2**24), so the
+    # collected mean tells which dtype the statistics were computed in
+    df = cudf.DataFrame(
+        {
+            "name-string": ["a", "b", "c", "d"] * 5,
+            "x": [2.0 ** 24 + 1] * 20,
+            "y": np.arange(20, dtype="float64"),
+            "label": [0, 1] * 10,
+        }
+    )
+    path = str(tmpdir.join("data.parquet"))
+    df.to_parquet(path)
+
+    processor = nvt.Workflow(
+        cat_names=["name-string"],
+        cont_names=["x", "y"],
+        label_name=["label"],
+        to_cpu=False,
+        cont_dtype="float32",
+    )
+    processor.add_preprocess(ops.Normalize(replace=False))
+    processor.finalize()
+
+    data_itr = nvtabular.io.GPUDatasetIterator(path, use_row_groups=True)
+    processor.update_stats(data_itr)
+    assert processor.stats["means"]["x"] == float(df.x.astype("float32").mean())
+    assert processor.stats["means"]["x"] != float(df.x.mean())
+
+    new_gdf = processor.apply_ops(df.copy())
+    # the original columns are kept, so their dtype is the cast's alone
+    assert new_gdf["x"].dtype == "float32"
+    assert new_gdf["y"].dtype == "float32"
+    assert_eq(new_gdf["y"], df["y"].astype("float32"), check_names=False)
+    assert "y_Normalize" in new_gdf.columns